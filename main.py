@@ -1,14 +1,37 @@
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import heapq
+import http.client
 import importlib.machinery
 import importlib.util
+import json
+import multiprocessing
 import os
 import platform
+import queue
 import random
+import re
 import shutil
+import socketserver
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from multiprocessing import shared_memory
 from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
 
-from PIL import Image
+from PIL import Image, ImageOps
 
 # --- PATH & ASSETS SETUP ---
 # 1. Internal Path (Source files inside EXE/Build)
@@ -44,6 +67,9 @@ MODEL_DIR = APP_DATA / "models"
 REALESRGAN_DIR = APP_DATA / "realesrgan"
 PLUGIN_DIR = APP_DATA / "plugins"
 FFMPEG_DIR = APP_DATA / "ffmpeg"
+MASK_CACHE_DIR = APP_DATA / "mask_cache"
+MASK_CACHE_LIMIT_MB = 1024
+U2NET_INPUT = 320  # U^2-Net input side; inference images need no more than this
 
 # Setup Environment Variables
 os.environ["U2NET_HOME"] = str(MODEL_DIR)
@@ -58,13 +84,14 @@ ICON_PATH = INTERNAL_DIR / "labokit.ico"
 remove = None
 
 # --- IMPORTS ---
-from PySide6.QtCore import Qt, QSize, QTimer, QUrl
+from PySide6.QtCore import Qt, QObject, QSize, QTimer, QUrl, Signal
 from PySide6.QtGui import QAction, QPixmap, QFont, QIcon, QDesktopServices
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QListWidget, QListWidgetItem, QLabel, QPushButton, QFileDialog,
     QMessageBox, QProgressDialog, QFrame, QComboBox, QTabWidget,
-    QDialog, QPlainTextEdit, QSplashScreen
+    QDialog, QPlainTextEdit, QSplashScreen, QCheckBox, QSpinBox, QLineEdit,
+    QFormLayout, QDialogButtonBox
 )
 
 IMAGE_FILTER = (
@@ -96,6 +123,19 @@ BG_PRESETS = {
 }
 DEFAULT_PRESET_NAME = "Standard"
 
+# --- UPSCALER OPTIONS ---
+UPSCALE_MODELS = ["realesrgan-x4plus", "realesrgan-x4plus-anime"]
+UPSCALE_SCALES = ["2x", "4x"]
+# auto = Vulkan when the NCNN binary exists and works, otherwise CPU (ONNX)
+UPSCALE_ENGINES = {"Auto": "auto", "Vulkan (NCNN)": "vulkan", "CPU (ONNX)": "cpu"}
+
+# --- LOCAL SERVER ---
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = int(os.getenv("LABOKIT_PORT", "8765"))
+SERVER_SOCKET = os.getenv("LABOKIT_SOCKET", "")
+# /health reply; bump the protocol number when the endpoints change
+SERVER_HEALTH = b"LABOKit-server/1"
+
 
 # --- SMART DEPLOYMENT (SILENT) ---
 def deploy_assets():
@@ -135,6 +175,1565 @@ def deploy_assets():
                     pass
 
 
+# ==========================================
+# SETTINGS & RESOURCE GOVERNOR
+# ==========================================
+
+SETTINGS_PATH = APP_DATA / "settings.json"
+DEFAULT_SETTINGS = {
+    "intra_op_threads": 0,  # onnxruntime pools, 0 = all cores
+    "inter_op_threads": 0,
+    "esrgan_threads": "",  # realesrgan -j load:proc:save, "" = default 1:2:2
+    "low_priority": False,
+    "ram_limit_mb": 0,  # 0 = no ceiling
+    "adaptive": True,  # shrink concurrency under memory pressure / load
+    "ort_provider": "auto",  # see ORT_PROVIDERS
+    "graph_opt_level": "all",  # see GRAPH_OPT_LEVELS
+    "upscale_engine": "auto",  # see UPSCALE_ENGINES
+}
+
+# Execution provider choices -> preference order (filtered by what is installed)
+ORT_PROVIDERS = {
+    "auto": [
+        "CUDAExecutionProvider",
+        "DmlExecutionProvider",
+        "OpenVINOExecutionProvider",
+        "DnnlExecutionProvider",
+        "CPUExecutionProvider",
+    ],
+    "cpu": ["CPUExecutionProvider"],
+    "dnnl": ["DnnlExecutionProvider", "CPUExecutionProvider"],
+    "openvino": ["OpenVINOExecutionProvider", "CPUExecutionProvider"],
+}
+GRAPH_OPT_LEVELS = ["all", "extended", "basic", "disabled"]
+
+
+def load_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        settings.update(json.loads(SETTINGS_PATH.read_text(encoding="utf-8")))
+    except Exception:
+        pass
+    return settings
+
+
+def save_settings(settings):
+    SETTINGS_PATH.write_text(json.dumps(settings, indent=2), encoding="utf-8")
+
+
+class ResourceGovernor:
+    """Caps threads / priority / RAM so batch jobs leave room for other work"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._status = (0.0, None, None, None)
+        self._niced = False
+
+    def update(self, settings):
+        self.settings = settings
+        self._status = (0.0, None, None, None)
+        self.apply_priority()
+
+    # --- limits ---
+    def session_options(self):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = {
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "disabled": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        }.get(self.settings["graph_opt_level"], ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        if self.settings["intra_op_threads"] > 0:
+            opts.intra_op_num_threads = self.settings["intra_op_threads"]
+        if self.settings["inter_op_threads"] > 0:
+            opts.inter_op_num_threads = self.settings["inter_op_threads"]
+        return opts
+
+    def esrgan_args(self):
+        jobs = self.settings["esrgan_threads"].strip()
+        return ["-j", jobs] if jobs else []
+
+    def apply_priority(self):
+        """Lower the priority of this process (child processes inherit it)"""
+        if not self.settings["low_priority"] or self._niced:
+            return
+        try:
+            if sys.platform == "win32":
+                BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+                k32 = ctypes.windll.kernel32
+                k32.SetPriorityClass(k32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                os.nice(10)
+            self._niced = True
+        except Exception as e:
+            print(f"Priority error: {e}")
+
+    # --- measurements ---
+    def _measure(self):
+        """(available MB, total MB, own RSS MB, load per core), any may be None"""
+        avail = total = rss = load = None
+        try:
+            import psutil
+
+            vm = psutil.virtual_memory()
+            avail, total = vm.available / 2 ** 20, vm.total / 2 ** 20
+            rss = psutil.Process().memory_info().rss / 2 ** 20
+            # Run-queue length, unlike cpu_percent, can exceed the core count
+            load = psutil.getloadavg()[0] / (psutil.cpu_count() or 1)
+        except ImportError:
+            try:
+                with open("/proc/meminfo") as f:
+                    info = {l.split(":")[0]: int(l.split()[1]) for l in f}
+                avail, total = info["MemAvailable"] / 1024, info["MemTotal"] / 1024
+                with open("/proc/self/statm") as f:
+                    rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+            except (OSError, KeyError, ValueError):
+                pass
+            if hasattr(os, "getloadavg"):
+                load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        return avail, total, rss, load
+
+    def status(self):
+        now = time.monotonic()
+        if now - self._status[0] > 1.0:
+            self._status = (now, *self._measure())
+        return self._status[1:]
+
+    def allowed_workers(self, wanted):
+        """How many of `wanted` parallel jobs the machine can take right now"""
+        n = max(1, wanted)
+        if not self.settings["adaptive"]:
+            return n
+        avail, total, _, load = self.status()
+        if avail is not None and total:
+            if avail < total * 0.10:
+                n = 1
+            elif avail < total * 0.25:
+                n = max(1, n // 2)
+        if load is not None and load > 1.0:
+            n = max(1, int(n / load))
+        return n
+
+    def memory_ok(self):
+        """False while this process is above the RAM ceiling"""
+        limit = self.settings["ram_limit_mb"]
+        if limit <= 0:
+            return True
+        rss = self.status()[2]
+        return rss is None or rss < limit
+
+
+GOVERNOR = ResourceGovernor(load_settings())
+
+
+# ==========================================
+# PROCESSING CORE
+# ==========================================
+
+_SESSIONS = {}
+_SESSION_LOCK = threading.Lock()
+
+
+def _has_cuda_driver():
+    if sys.platform == "win32":
+        root = Path(os.environ.get("SystemRoot", r"C:\Windows"))
+        return (root / "System32" / "nvcuda.dll").exists()
+
+    return os.path.exists("/proc/driver/nvidia/version") or bool(ctypes.util.find_library("cuda"))
+
+
+def ort_providers(choice=None):
+    """Execution providers for the configured choice that are actually usable here"""
+    import onnxruntime as ort
+
+    available = set(ort.get_available_providers())
+    choice = choice or GOVERNOR.settings["ort_provider"]
+    wanted = ORT_PROVIDERS.get(choice, ORT_PROVIDERS["auto"])
+    # onnxruntime-gpu lists CUDA even without a driver; probing it then stalls
+    if "CUDAExecutionProvider" in available and not _has_cuda_driver():
+        available.discard("CUDAExecutionProvider")
+    return [p for p in wanted if p in available] or ["CPUExecutionProvider"]
+
+
+def build_ort_session(model_path, name, intra_threads=None):
+    """InferenceSession with the configured providers / threads.
+
+    On the plain CPU provider the graph-optimized model is written once to
+    MODEL_DIR/optimized and loaded from there afterwards. The saved model
+    stops at the "extended" level (the "all" passes are hardware-specific
+    and still run on load); other providers compile nodes that ORT cannot
+    save, so they always start from the original model. The saved file name
+    carries the source model's size and mtime, so a replaced model is
+    re-optimized. `model_path` may be a callable that locates (or
+    downloads) the original model.
+    """
+    import onnxruntime as ort
+
+    providers = ort_providers()
+    src = str(model_path() if callable(model_path) else model_path)
+
+    def options():
+        opts = GOVERNOR.session_options()
+        if intra_threads:
+            opts.intra_op_num_threads = intra_threads
+        return opts
+
+    level = GOVERNOR.settings["graph_opt_level"]
+    if level == "disabled" or providers != ["CPUExecutionProvider"]:
+        return ort.InferenceSession(src, sess_options=options(), providers=providers)
+
+    saved = "basic" if level == "basic" else "extended"
+    st = os.stat(src)
+    opt_dir = MODEL_DIR / "optimized"
+    opt_path = opt_dir / (
+        f"{name}.cpu.{saved}.ort{ort.__version__}.{st.st_size:x}-{st.st_mtime_ns:x}.onnx"
+    )
+    if not opt_path.exists():
+        # Graphs optimized from an older copy of this model are stale now
+        for old in opt_dir.glob(f"{name}.cpu.*.onnx"):
+            old.unlink(missing_ok=True)
+        opts = options()
+        opts.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+            if saved == "basic"
+            else ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        )
+        opts.optimized_model_filepath = str(opt_path)
+        try:
+            opt_path.parent.mkdir(parents=True, exist_ok=True)
+            ort.InferenceSession(src, sess_options=opts, providers=providers)
+        except Exception as e:
+            print(f"Could not save optimized model ({e})")
+            opt_path.unlink(missing_ok=True)
+            return ort.InferenceSession(src, sess_options=options(), providers=providers)
+    try:
+        return ort.InferenceSession(str(opt_path), sess_options=options(), providers=providers)
+    except Exception as e:
+        print(f"Optimized model rejected ({e}), using the original")
+        opt_path.unlink(missing_ok=True)
+        return ort.InferenceSession(src, sess_options=options(), providers=providers)
+
+
+def _new_session(model_name):
+    try:
+        from rembg.sessions import sessions_class
+    except ImportError:
+        from rembg import new_session
+
+        return new_session(model_name, providers=ort_providers())
+
+    cls = next(c for c in sessions_class if c.name() == model_name)
+    # Build the rembg session around our own InferenceSession
+    sess = cls.__new__(cls)
+    sess.model_name = model_name
+    sess.providers = ort_providers()
+    # rembg keeps its models in U2NET_HOME (= MODEL_DIR); use the file directly
+    # when present, since download_models() re-hashes the whole file
+    onnx = MODEL_DIR / f"{model_name}.onnx"
+    sess.inner_session = build_ort_session(
+        onnx if onnx.exists() else cls.download_models, model_name
+    )
+    return sess
+
+
+def get_session(model_name="u2net"):
+    """Return a warm rembg session (loaded once per process)"""
+    with _SESSION_LOCK:
+        if model_name not in _SESSIONS:
+            _SESSIONS[model_name] = _new_session(model_name)
+        return _SESSIONS[model_name]
+
+
+def reset_sessions():
+    """Drop cached sessions so the next job picks up new settings"""
+    with _SESSION_LOCK:
+        _SESSIONS.clear()
+        _ESRGAN_SESSIONS.clear()
+
+
+def _inference_proxy(data=None, img=None):
+    """Cheap reduced-resolution image for segmentation (at least U2NET_INPUT px per side).
+
+    JPEG bytes are decoded DCT-scaled (1/2 .. 1/8) instead of in full;
+    already decoded images get a fast box-filter reduce.
+    """
+    if data is not None:
+        src = Image.open(BytesIO(data))
+        if src.format != "JPEG":
+            return None
+        src.draft("RGB", (U2NET_INPUT, U2NET_INPUT))
+        return ImageOps.exif_transpose(src)
+    factor = min(img.size) // U2NET_INPUT
+    return img.reduce(factor) if factor >= 2 else None
+
+
+def get_mask(img, digest=None, model_name="u2net", proxy=None):
+    """Raw U^2-Net mask (mode L, image size) before any preset post-processing.
+
+    With a content digest the mask is cached on disk at inference resolution
+    (about U2NET_INPUT px per side), so switching presets only re-runs
+    post-processing and compositing. `proxy()` may return a smaller copy of
+    img to run inference on; it is only called on a cache miss.
+    """
+    import numpy as np
+
+    cache = MASK_CACHE_DIR / model_name / f"{digest}.npz" if digest else None
+    if cache and cache.exists():
+        try:
+            with np.load(cache) as z:
+                arr = z["mask"]
+            h, w = arr.shape
+            # Same aspect up to the rounding of the reduced size
+            if abs(w * img.height - h * img.width) <= img.width + img.height:
+                return Image.fromarray(arr, "L").resize(img.size, Image.Resampling.BILINEAR)
+        except Exception:
+            pass
+
+    small = proxy() if proxy else None
+    raw = get_session(model_name).predict(img if small is None else small)[0].convert("L")
+    if cache:
+        factor = min(raw.size) // U2NET_INPUT
+        stored = raw.reduce(factor) if factor >= 2 else raw
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_name(f"{cache.stem}.{threading.get_ident()}.tmp.npz")
+            np.savez_compressed(tmp, mask=np.asarray(stored, dtype=np.uint8))
+            os.replace(tmp, cache)
+        except OSError as e:
+            print(f"Mask cache error: {e}")
+    if raw.size != img.size:
+        raw = raw.resize(img.size, Image.Resampling.BILINEAR)
+    return raw
+
+
+def apply_preset(img, mask, preset_name):
+    """Preset post-processing on a raw mask -> (RGBA cutout, final mask)"""
+    import numpy as np
+    from rembg.bg import alpha_matting_cutout, naive_cutout, post_process
+
+    opts = BG_PRESETS.get(preset_name, {})
+    if opts.get("post_process_mask"):
+        mask = Image.fromarray(post_process(np.array(mask)))
+    if opts.get("alpha_matting"):
+        try:
+            cutout = alpha_matting_cutout(
+                img,
+                mask,
+                opts["alpha_matting_foreground_threshold"],
+                opts["alpha_matting_background_threshold"],
+                opts["alpha_matting_erode_structure_size"],
+            )
+        except ValueError:
+            cutout = naive_cutout(img, mask)
+    else:
+        cutout = naive_cutout(img, mask)
+    return cutout, mask
+
+
+def remove_background(data, preset_name=DEFAULT_PRESET_NAME, mask_path=None):
+    """Accepts bytes, a PIL image or an ndarray and returns the same type.
+
+    Only encoded bytes are hashed and use the mask cache. `mask_path`
+    additionally saves the final mask as a grayscale PNG.
+    """
+    import numpy as np
+
+    digest = None
+    if isinstance(data, (bytes, bytearray)):
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        # The only full-resolution decode; it is needed for compositing
+        img = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+        proxy = lambda: _inference_proxy(data=data)
+    else:
+        img = Image.fromarray(data) if isinstance(data, np.ndarray) else data
+        proxy = lambda: _inference_proxy(img=img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+
+    cutout, mask = apply_preset(img, get_mask(img, digest, proxy=proxy), preset_name)
+    if mask_path:
+        mask.save(mask_path)
+
+    if isinstance(data, (bytes, bytearray)):
+        buf = BytesIO()
+        cutout.save(buf, "PNG")
+        return buf.getvalue()
+    if isinstance(data, np.ndarray):
+        return np.asarray(cutout)
+    return cutout
+
+
+def prune_mask_cache(limit_mb=MASK_CACHE_LIMIT_MB):
+    """Drop the least recently written masks once the cache outgrows limit_mb"""
+    if not MASK_CACHE_DIR.exists():
+        return
+    files = sorted(
+        ((f.stat().st_mtime, f.stat().st_size, f) for f in MASK_CACHE_DIR.rglob("*.npz")),
+        reverse=True,
+    )
+    total = 0
+    for _, size, f in files:
+        total += size
+        if total > limit_mb * 2 ** 20:
+            f.unlink(missing_ok=True)
+
+
+def _esrgan(src, dst, model, extra=()):
+    cmd = [
+        str(REALESRGAN_EXE),
+        "-i",
+        str(src),
+        "-o",
+        str(dst),
+        "-n",
+        model,
+        "-s",
+        "4",
+        *GOVERNOR.esrgan_args(),
+        *extra,
+    ]
+    flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    return subprocess.run(
+        cmd,
+        capture_output=True,
+        creationflags=flags,
+        cwd=str(REALESRGAN_DIR),
+    )
+
+
+def _finish_scale(opath, target_scale):
+    # Real-ESRGAN always runs at 4x; 2x is a downscale of that result
+    if target_scale == 2:
+        with Image.open(opath) as img:
+            new_w = img.width // 2
+            new_h = img.height // 2
+            img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            img.save(opath)
+
+
+# --- CPU engine (Real-ESRGAN ONNX models through onnxruntime) ---
+ESRGAN_TILE = 192  # input pixels per tile side
+ESRGAN_TILE_OVERLAP = 16
+ESRGAN_TILE_WORKERS = 2  # overlaps tile prep / blending with inference
+
+_ESRGAN_SESSIONS = {}
+_VULKAN_FAILED = False
+
+
+def esrgan_onnx_path(model):
+    return MODEL_DIR / f"{model}.onnx"
+
+
+def upscale_engine():
+    """'vulkan' or 'cpu' for the configured engine"""
+    choice = GOVERNOR.settings["upscale_engine"]
+    if choice == "auto":
+        return "vulkan" if REALESRGAN_EXE.exists() and not _VULKAN_FAILED else "cpu"
+    return choice
+
+
+def _esrgan_session(model):
+    with _SESSION_LOCK:
+        if model not in _ESRGAN_SESSIONS:
+            path = esrgan_onnx_path(model)
+            if not path.exists():
+                raise FileNotFoundError(f"CPU upscaler model not found:\n{path}")
+            # Concurrent runs share this session's single intra-op pool, so
+            # it keeps every core; extra tile threads only overlap the
+            # numpy pre/post work with inference
+            _ESRGAN_SESSIONS[model] = build_ort_session(path, model)
+        return _ESRGAN_SESSIONS[model]
+
+
+def _ramp(n, overlap, lead, trail):
+    import numpy as np
+
+    w = np.ones(n, np.float32)
+    ov = min(overlap, n // 2)
+    if ov:
+        edge = np.linspace(1.0 / (ov + 1), 1.0, ov, endpoint=False, dtype=np.float32)
+        if lead:
+            w[:ov] = edge
+        if trail:
+            w[n - ov:] = edge[::-1]
+    return w
+
+
+def _tile_starts(size, tile, step):
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile, step))
+    return starts + [size - tile]
+
+
+def _blend_weights(size, tile, starts, overlap, scale):
+    """Per-tile 1D ramps, normalized so overlapping tiles sum to exactly 1"""
+    import numpy as np
+
+    ramps = []
+    total = np.zeros(size * scale, np.float32)
+    for i, st in enumerate(starts):
+        n = min(tile, size - st) * scale
+        r = _ramp(n, overlap * scale, i > 0, i < len(starts) - 1)
+        total[st * scale:st * scale + n] += r
+        ramps.append(r)
+    return [r / total[st * scale:st * scale + len(r)] for r, st in zip(ramps, starts)]
+
+
+def upscale_image_cpu(img, model, target_scale, tile=ESRGAN_TILE, overlap=ESRGAN_TILE_OVERLAP):
+    """Tiled Real-ESRGAN on CPU.
+
+    Overlapping tiles are blended with linear ramps. Only one row of tiles
+    is held in float precision, so memory stays bounded for large images.
+    """
+    import numpy as np
+
+    sess = _esrgan_session(model)
+    inp = sess.get_inputs()[0]
+    dtype = np.float16 if "float16" in inp.type else np.float32
+    scale = 4
+
+    rgb = np.asarray(img.convert("RGB"), dtype=np.float32) / 255.0
+    h, w = rgb.shape[:2]
+    ys = _tile_starts(h, tile, tile - overlap)
+    xs = _tile_starts(w, tile, tile - overlap)
+    wys = _blend_weights(h, tile, ys, overlap, scale)
+    wxs = _blend_weights(w, tile, xs, overlap, scale)
+
+    def run(y, x):
+        patch = rgb[y:y + tile, x:x + tile].transpose(2, 0, 1)[None].astype(dtype)
+        res = sess.run(None, {inp.name: patch})[0][0].astype(np.float32)
+        return res.transpose(1, 2, 0)
+
+    out = np.empty((h * scale, w * scale, 3), np.uint8)
+    carry = None
+    workers = GOVERNOR.allowed_workers(ESRGAN_TILE_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for r, y in enumerate(ys):
+            th = min(tile, h - y) * scale
+            band = np.zeros((th, w * scale, 3), np.float32)
+            if carry is not None:
+                band[:carry.shape[0]] += carry
+            for x, wx, res in zip(xs, wxs, pool.map(lambda x: run(y, x), xs)):
+                band[:, x * scale:x * scale + res.shape[1]] += (
+                    res * wys[r][:, None, None] * wx[None, :, None]
+                )
+            # Rows the next tile row doesn't reach are final
+            cut = (ys[r + 1] - y) * scale if r + 1 < len(ys) else th
+            out[y * scale:y * scale + cut] = (np.clip(band[:cut], 0, 1) * 255.0 + 0.5).astype(np.uint8)
+            carry = band[cut:]
+
+    res = Image.fromarray(out, "RGB")
+    if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+        alpha = img.convert("RGBA").getchannel("A").resize(res.size, Image.Resampling.LANCZOS)
+        res.putalpha(alpha)
+    if target_scale != scale:
+        res = res.resize((w * target_scale, h * target_scale), Image.Resampling.LANCZOS)
+    return res
+
+
+def _upscale_file_cpu(src, dst, model, target_scale):
+    with Image.open(src) as img:
+        upscale_image_cpu(img, model, target_scale).save(dst)
+
+
+# stderr fragments of realesrgan-ncnn-vulkan that mean the GPU itself is unusable
+VULKAN_ERRORS = (
+    "vkcreateinstance failed",
+    "vkcreatedevice failed",
+    "vkallocatememory failed",
+    "vkqueuesubmit failed",
+    "invalid gpu device",
+    "failed to create gpu instance",
+)
+
+
+def _vulkan_device_error(proc, err):
+    """True for driver/device failures, False for e.g. an unreadable input file"""
+    # Negative: killed by a signal; >= 0xC0000000: Windows crash status
+    if proc.returncode < 0 or proc.returncode >= 0xC0000000:
+        return True
+    err = err.lower()
+    return any(m in err for m in VULKAN_ERRORS)
+
+
+def _vulkan_failed(model, proc, err):
+    """In auto mode a Vulkan device error switches this process to the CPU engine"""
+    global _VULKAN_FAILED
+    if (
+        GOVERNOR.settings["upscale_engine"] == "auto"
+        and esrgan_onnx_path(model).exists()
+        and _vulkan_device_error(proc, err)
+    ):
+        print(f"Vulkan upscaler failed ({err}), using CPU engine")
+        _VULKAN_FAILED = True
+        return True
+    return False
+
+
+def upscale_file(src, dst, model, target_scale):
+    if upscale_engine() == "cpu":
+        return _upscale_file_cpu(src, dst, model, target_scale)
+    proc = _esrgan(src, dst, model)
+    if not Path(dst).exists():
+        err = proc.stderr.decode(errors="replace").strip() or "no output"
+        if _vulkan_failed(model, proc, err):
+            return _upscale_file_cpu(src, dst, model, target_scale)
+        raise RuntimeError(err)
+    _finish_scale(dst, target_scale)
+
+
+def upscale_files(pairs, model, target_scale):
+    """Upscale many (src, dst) pairs with a single Real-ESRGAN process"""
+    if upscale_engine() == "cpu":
+        for src, dst in pairs:
+            _upscale_file_cpu(src, dst, model, target_scale)
+        return [dst for _, dst in pairs]
+
+    with tempfile.TemporaryDirectory(prefix="labokit_") as tmp:
+        in_dir, out_dir = Path(tmp) / "in", Path(tmp) / "out"
+        in_dir.mkdir()
+        out_dir.mkdir()
+        for i, (src, _) in enumerate(pairs):
+            link = in_dir / f"{i:06d}{Path(src).suffix.lower()}"
+            try:
+                os.link(src, link)
+            except OSError:
+                shutil.copy2(src, link)
+        proc = _esrgan(in_dir, out_dir, model, ("-f", "png"))
+
+        done = []
+        for i, (_, dst) in enumerate(pairs):
+            res = out_dir / f"{i:06d}.png"
+            if res.exists():
+                shutil.move(str(res), str(dst))
+                _finish_scale(dst, target_scale)
+                done.append(dst)
+        if not done and pairs:
+            err = proc.stderr.decode(errors="replace").strip() or "no output"
+            if _vulkan_failed(model, proc, err):
+                return upscale_files(pairs, model, target_scale)
+            raise RuntimeError(err)
+        return done
+
+
+# RAM-backed scratch space where available (the NCNN binary only takes paths)
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def upscale_image(img, model, target_scale):
+    """Upscale a PIL image in memory"""
+    if upscale_engine() == "cpu":
+        return upscale_image_cpu(img, model, target_scale)
+    with tempfile.TemporaryDirectory(prefix="labokit_", dir=SCRATCH_DIR) as tmp:
+        src, dst = Path(tmp) / "in.png", Path(tmp) / "out.png"
+        img.save(src, compress_level=0)
+        upscale_file(src, dst, model, target_scale)
+        with Image.open(dst) as res:
+            return res.copy()
+
+
+# ==========================================
+# INGESTION & SCHEDULING
+# ==========================================
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".gif"}
+
+# Rough seconds per megapixel, refined from measured runs
+BG_SEC_PER_MP = 0.5
+UP_SEC_PER_MP = 6.0
+BG_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def read_image_info(path):
+    """(width, height, mode, frames) from the file headers, pixels are not decoded"""
+    try:
+        with Image.open(path) as img:
+            return img.width, img.height, img.mode, getattr(img, "n_frames", 1)
+    except Exception:
+        return None
+
+
+def read_image_infos(paths, workers=8):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(read_image_info, paths)))
+
+
+# LABOKit's own result folders are never scanned as inputs
+OUTPUT_DIR_NAMES = {"LABOKit_BG", "LABOKit_UP"}
+
+
+def _scan_dir(d, exclude=frozenset()):
+    files, dirs = [], []
+    try:
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    if e.name in OUTPUT_DIR_NAMES or os.path.normcase(e.path) in exclude:
+                        continue
+                    dirs.append(e.path)
+                elif Path(e.name).suffix.lower() in IMAGE_EXTS:
+                    files.append(Path(e.path))
+    except OSError:
+        pass
+    return files, dirs
+
+
+def scan_images(root, workers=8, exclude=()):
+    """Recursively collect images below root (directories scanned in parallel).
+
+    Folders named in OUTPUT_DIR_NAMES and the paths in `exclude` are skipped.
+    """
+    exclude = frozenset(os.path.normcase(str(Path(root) / e)) for e in exclude)
+    found = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root, exclude)}
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                files, dirs = fut.result()
+                found.extend(files)
+                pending |= {pool.submit(_scan_dir, d, exclude) for d in dirs}
+    return sorted(found)
+
+
+def output_bases(paths, roots, out):
+    """Unique output stem per input (out/<subfolder>/<stem>).
+
+    Files imported from a folder keep their subfolder below the scanned
+    root; remaining name clashes get a _2, _3, ... suffix.
+    """
+    bases, taken = {}, set()
+    for p in paths:
+        root = roots.get(p)
+        sub = p.parent.relative_to(root) if root else Path()
+        base, n = out / sub / p.stem, 2
+        while os.path.normcase(str(base)) in taken:
+            base, n = out / sub / f"{p.stem}_{n}", n + 1
+        taken.add(os.path.normcase(str(base)))
+        base.parent.mkdir(parents=True, exist_ok=True)
+        bases[p] = base
+    return bases
+
+
+def image_cost(path, info):
+    """Processing cost in megapixels (1 MP when the header is unknown)"""
+    meta = info.get(path)
+    return meta[0] * meta[1] * meta[3] / 1e6 if meta else 1.0
+
+
+def schedule_by_cost(paths, info, workers=1):
+    """Largest first, so one huge image can't stall the tail of a batch.
+
+    Returns the ordered paths and the greedy (LPT) makespan in megapixels.
+    """
+    order = sorted(paths, key=lambda p: image_cost(p, info), reverse=True)
+    loads = [0.0] * max(1, workers)
+    for p in order:
+        heapq.heappush(loads, heapq.heappop(loads) + image_cost(p, info))
+    return order, max(loads)
+
+
+def format_eta(seconds):
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    if h:
+        return f"{h}h {m:02d}m"
+    if m:
+        return f"{m}m {s:02d}s"
+    return f"{s}s"
+
+
+class BatchRun:
+    """Runs `fn(path)` on a worker pool in cost order while pumping the Qt event loop"""
+
+    def __init__(self, paths, fn, info, workers=1, sec_per_mp=1.0):
+        self.fn = fn
+        self.info = info
+        self.workers = max(1, workers)
+        self.rate = sec_per_mp
+        self.order, makespan = schedule_by_cost(paths, info, self.workers)
+        self.eta = makespan * sec_per_mp
+
+    def __len__(self):
+        return len(self.order)
+
+    def iter(self, dlg, verb="Processing"):
+        """Yields (path, result, error); stops early when dlg is cancelled"""
+        todo = list(self.order)
+        left_mp = sum(image_cost(p, self.info) for p in todo)
+        done_mp, t0 = 0.0, time.monotonic()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while todo or running:
+                # Concurrency follows memory pressure / load; the RAM ceiling
+                # only holds back new jobs while others are still running
+                limit = GOVERNOR.allowed_workers(self.workers)
+                while (
+                    todo
+                    and len(running) < limit
+                    and not dlg.wasCanceled()
+                    and (not running or GOVERNOR.memory_ok())
+                ):
+                    p = todo.pop(0)
+                    running[pool.submit(self.fn, p)] = p
+                    dlg.setLabelText(
+                        f"{verb} {p.name}...\n~{format_eta(left_mp * self.rate / self.workers)} left"
+                    )
+                if not running:
+                    break
+                finished, _ = wait(running, timeout=0.05, return_when=FIRST_COMPLETED)
+                QApplication.processEvents()
+                for fut in finished:
+                    p = running.pop(fut)
+                    cost = image_cost(p, self.info)
+                    left_mp -= cost
+                    done_mp += cost
+                    try:
+                        yield p, fut.result(), None
+                    except Exception as e:
+                        yield p, None, e
+                if done_mp:
+                    self.rate = (time.monotonic() - t0) * self.workers / done_mp
+                if dlg.wasCanceled():
+                    todo.clear()
+
+
+# ==========================================
+# MULTI-FRAME IMAGES (GIF / WebP / TIFF)
+# ==========================================
+
+# BG removal needs real alpha, so animated GIFs come out as animated WebP
+MULTIFRAME_BG_EXT = {".gif": ".webp", ".webp": ".webp", ".tif": ".tif", ".tiff": ".tiff"}
+FRAME_WORKERS = BG_WORKERS
+# Largest per-pixel channel difference (0-255) at which a frame result is reused;
+# absorbs dither / lossy-codec noise but not real motion
+FRAME_MAX_DIFF = 6
+
+
+def load_frames(path):
+    """All frames as RGBA images plus per-frame durations (ms) and loop count.
+
+    The loop count is None when the source plays once (a GIF without a
+    NETSCAPE extension).
+    """
+    with Image.open(path) as img:
+        loop = img.info.get("loop")
+        frames, durations = [], []
+        for i in range(getattr(img, "n_frames", 1)):
+            img.seek(i)
+            frames.append(img.convert("RGBA"))
+            durations.append(img.info.get("duration", 100))
+        return frames, durations, loop
+
+
+def save_frames(path, frames, durations, loop=None):
+    path = Path(path)
+    ext = path.suffix.lower()
+    opts = {"save_all": True, "append_images": frames[1:]}
+    if ext in (".tif", ".tiff"):
+        opts["compression"] = "tiff_deflate"
+    else:
+        opts["duration"] = durations
+        if loop is not None:
+            opts["loop"] = loop
+        elif ext == ".webp":
+            opts["loop"] = 1  # WebP counts plays and defaults to 0 (forever)
+        if ext == ".gif":
+            opts["disposal"] = 2
+        else:
+            opts.update(quality=90, method=4)
+    frames[0].save(path, **opts)
+
+
+def dedupe_frames(frames, max_diff=FRAME_MAX_DIFF):
+    """For each frame, the index of the frame whose result it can reuse.
+
+    Byte-identical frames always match; otherwise a frame reuses the last
+    distinct frame when no pixel channel differs by more than `max_diff`.
+    """
+    import numpy as np
+
+    src, seen = [], {}
+    key_arr = key_idx = None
+    for i, f in enumerate(frames):
+        key = (f.mode, f.size, hashlib.blake2b(f.tobytes(), digest_size=16).digest())
+        if key not in seen:
+            arr = np.asarray(f, dtype=np.int16)
+            if (
+                key_arr is not None
+                and arr.shape == key_arr.shape
+                and np.abs(arr - key_arr).max() <= max_diff
+            ):
+                seen[key] = key_idx
+            else:
+                key_arr, key_idx = arr, i
+                seen[key] = i
+        src.append(seen[key])
+    return src
+
+
+def map_unique_frames(frames, fn, workers=FRAME_WORKERS):
+    """Apply fn to each distinct frame in parallel and fan the results back out"""
+    src = dedupe_frames(frames)
+    uniq = sorted(set(src))
+    with ThreadPoolExecutor(max_workers=GOVERNOR.allowed_workers(workers)) as pool:
+        results = dict(zip(uniq, pool.map(lambda i: fn(frames[i]), uniq)))
+    return [results[i] for i in src]
+
+
+def upscale_frames(frames, model, target_scale):
+    """Upscale the distinct frames with one Real-ESRGAN process"""
+    if upscale_engine() == "cpu":
+        # Tiles already use every core, so frames go one at a time
+        return map_unique_frames(
+            frames, lambda f: upscale_image_cpu(f, model, target_scale).convert("RGBA"), 1
+        )
+    src = dedupe_frames(frames)
+    uniq = sorted(set(src))
+    with tempfile.TemporaryDirectory(prefix="labokit_", dir=SCRATCH_DIR) as tmp:
+        pairs = []
+        for i in uniq:
+            fin = Path(tmp) / f"f{i:06d}.png"
+            frames[i].save(fin, compress_level=1)
+            pairs.append((fin, Path(tmp) / f"u{i:06d}.png"))
+        upscale_files(pairs, model, target_scale)
+        results = {}
+        for i, (_, fout) in zip(uniq, pairs):
+            with Image.open(fout) as im:
+                results[i] = im.convert("RGBA")
+    return [results[i] for i in src]
+
+
+def process_animation(src, dst, fn_frames):
+    frames, durations, loop = load_frames(src)
+    save_frames(dst, fn_frames(frames), durations, loop)
+    return dst
+
+
+# ==========================================
+# VIDEO PIPELINE
+# ==========================================
+
+VIDEO_FILTER = "Videos (*.mp4 *.mov *.mkv *.webm *.avi *.MP4 *.MOV *.MKV *.WEBM *.AVI)"
+
+# Output container -> (video args, audio args). webm/mov/mkv keep the alpha channel.
+VIDEO_CODECS = {
+    ".mp4": (["-c:v", "libx264", "-crf", "18", "-pix_fmt", "yuv420p"], ["-c:a", "copy"]),
+    ".mkv": (["-c:v", "ffv1", "-pix_fmt", "yuva420p"], ["-c:a", "copy"]),
+    ".mov": (["-c:v", "qtrle"], ["-c:a", "copy"]),
+    ".webm": (["-c:v", "libvpx-vp9", "-pix_fmt", "yuva420p"], ["-c:a", "libopus"]),
+}
+
+
+def ffmpeg_bin(name="ffmpeg"):
+    exe = FFMPEG_DIR / (f"{name}.exe" if sys.platform == "win32" else name)
+    if exe.exists():
+        return str(exe)
+    return shutil.which(name) or str(exe)
+
+
+def probe_video(path):
+    cmd = [
+        ffmpeg_bin("ffprobe"), "-v", "error", "-select_streams", "v:0",
+        "-show_entries",
+        "stream=width,height,r_frame_rate,nb_frames:stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json", str(path),
+    ]
+    flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    out = subprocess.run(cmd, capture_output=True, creationflags=flags, check=True)
+    st = json.loads(out.stdout)["streams"][0]
+    nb = st.get("nb_frames", "0")
+    rot = st.get("tags", {}).get("rotate", 0)
+    for sd in st.get("side_data_list", []):
+        rot = sd.get("rotation", rot)
+    w, h = int(st["width"]), int(st["height"])
+    # ffmpeg autorotates on decode, so portrait phone clips arrive as H x W
+    if int(float(rot)) % 180:
+        w, h = h, w
+    return {
+        "width": w,
+        "height": h,
+        "fps": st.get("r_frame_rate", "30/1"),
+        "frames": int(nb) if str(nb).isdigit() else 0,
+    }
+
+
+class VideoPipeline:
+    """Decode -> process -> encode through ffmpeg pipes, no frame files on disk.
+
+    `process` maps an RGB uint8 ndarray (H, W, 3) to an RGB or RGBA ndarray.
+    Memory stays bounded: up to `queue_size` decoded frames wait in the
+    queue, up to `queue_size` more are in flight, plus the one the reader
+    holds (about 2 x queue_size + 1 frames).
+    """
+
+    def __init__(self, src, dst, process, queue_size=8, workers=1):
+        self.src = Path(src)
+        self.dst = Path(dst)
+        self.process = process
+        self.queue_size = queue_size
+        self.workers = workers
+        self.info = probe_video(src)
+        self._procs = []
+
+    def _popen(self, cmd, **kw):
+        flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        p = subprocess.Popen(cmd, creationflags=flags, stderr=subprocess.DEVNULL, **kw)
+        self._procs.append(p)
+        return p
+
+    def _decoder(self):
+        return self._popen(
+            [ffmpeg_bin(), "-v", "error", "-i", str(self.src),
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+            stdout=subprocess.PIPE,
+            bufsize=10 ** 7,
+        )
+
+    def _encoder(self, frame):
+        h, w, c = frame.shape
+        vargs, aargs = VIDEO_CODECS.get(self.dst.suffix.lower(), VIDEO_CODECS[".mp4"])
+        return self._popen(
+            [ffmpeg_bin(), "-y", "-v", "error",
+             "-f", "rawvideo", "-pix_fmt", "rgba" if c == 4 else "rgb24",
+             "-s", f"{w}x{h}", "-r", self.info["fps"], "-i", "-",
+             "-i", str(self.src), "-map", "0:v:0", "-map", "1:a?",
+             *vargs, *aargs, "-shortest", str(self.dst)],
+            stdin=subprocess.PIPE,
+        )
+
+    def _read_frames(self, dec, frames):
+        import numpy as np
+
+        w, h = self.info["width"], self.info["height"]
+        size = w * h * 3
+        while True:
+            buf = dec.stdout.read(size)
+            if len(buf) < size:
+                break
+            frames.put(np.frombuffer(buf, np.uint8).reshape(h, w, 3))
+        frames.put(None)
+
+    def run(self, progress=None):
+        """progress(done, total) may return True to cancel"""
+        import numpy as np
+
+        dec = self._decoder()
+        frames = queue.Queue(maxsize=self.queue_size)
+        threading.Thread(target=self._read_frames, args=(dec, frames), daemon=True).start()
+
+        enc = None
+        done = 0
+        pending = deque()
+        cancelled = False
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                eof = False
+                while not (eof and not pending):
+                    # Keep the pool fed but never more than queue_size frames in flight
+                    while not eof and len(pending) < self.queue_size:
+                        f = frames.get()
+                        if f is None:
+                            eof = True
+                        else:
+                            pending.append(pool.submit(self.process, f))
+                    if not pending:
+                        break
+                    res = np.ascontiguousarray(pending.popleft().result(), dtype=np.uint8)
+                    if enc is None:
+                        enc = self._encoder(res)
+                    enc.stdin.write(res.tobytes())
+                    done += 1
+                    if progress and progress(done, self.info["frames"]):
+                        cancelled = True
+                        for fut in pending:
+                            fut.cancel()
+                        break
+        finally:
+            if cancelled or dec.poll() is None:
+                dec.kill()
+            # Unblock the reader thread if it is waiting on a full queue
+            while True:
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    break
+            if enc:
+                enc.stdin.close()
+                if cancelled:
+                    enc.kill()
+            for p in self._procs:
+                p.wait()
+        if cancelled:
+            self.dst.unlink(missing_ok=True)
+        elif enc is None or enc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.dst.name}")
+        return done
+
+
+def video_remove_bg(preset_name):
+    import numpy as np
+
+    def process(frame):
+        res = remove_background(Image.fromarray(frame), preset_name)
+        return np.asarray(res.convert("RGBA"))
+
+    return process
+
+
+def video_upscale(model, target_scale):
+    import numpy as np
+
+    def process(frame):
+        return np.asarray(upscale_image(Image.fromarray(frame), model, target_scale).convert("RGB"))
+
+    return process
+
+
+# ==========================================
+# LOCAL INFERENCE SERVER
+# ==========================================
+
+
+class InferenceServer:
+    """Localhost service that keeps models warm and batches jobs across clients.
+
+    POST /remove?preset=Standard          body: image bytes -> PNG
+    POST /upscale?model=...&scale=4       body: image bytes -> PNG
+    GET  /health                          -> SERVER_HEALTH
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, socket_path="",
+                 batch_size=8, batch_wait=0.05):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.jobs = queue.Queue()
+        self.httpd = None
+
+    def submit(self, op, data, **params):
+        fut = Future()
+        self.jobs.put((op, tuple(sorted(params.items())), data, fut))
+        return fut
+
+    # --- worker ---
+    def _next_batch(self):
+        batch = [self.jobs.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.jobs.get(timeout=self.batch_wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            groups = {}
+            for job in self._next_batch():
+                groups.setdefault((job[0], job[1]), []).append(job)
+            for (op, params), jobs in groups.items():
+                try:
+                    if op == "remove":
+                        self._do_remove(dict(params), jobs)
+                    else:
+                        self._do_upscale(dict(params), jobs)
+                except Exception as e:
+                    for *_, fut in jobs:
+                        if not fut.done():
+                            fut.set_exception(e)
+
+    def _do_remove(self, params, jobs):
+        for _, _, data, fut in jobs:
+            try:
+                fut.set_result(remove_background(data, params["preset"]))
+            except Exception as e:
+                fut.set_exception(e)
+
+    def _do_upscale(self, params, jobs):
+        with tempfile.TemporaryDirectory(prefix="labokit_srv_") as tmp:
+            pairs, futs = [], []
+            for i, (_, _, data, fut) in enumerate(jobs):
+                # A bad upload only fails its own request, not the whole group
+                src = Path(tmp) / f"src_{i}.png"
+                try:
+                    with Image.open(BytesIO(data)) as img:
+                        img.save(src)
+                except Exception as e:
+                    fut.set_exception(e)
+                    continue
+                pairs.append((src, Path(tmp) / f"dst_{i}.png"))
+                futs.append(fut)
+            if pairs:
+                upscale_files(pairs, params["model"], params["scale"])
+            for (_, dst), fut in zip(pairs, futs):
+                if dst.exists():
+                    fut.set_result(dst.read_bytes())
+                else:
+                    fut.set_exception(RuntimeError("upscale failed"))
+
+    # --- http ---
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body, ctype="text/plain"):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                view = memoryview(body)
+                for i in range(0, len(view), 1 << 16):
+                    chunk = view[i:i + (1 << 16)]
+                    self.wfile.write(b"%x\r\n" % len(chunk))
+                    self.wfile.write(chunk)
+                    self.wfile.write(b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if urlparse(self.path).path == "/health":
+                    return self._reply(200, SERVER_HEALTH)
+                self._reply(404, b"not found")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if url.path == "/remove":
+                    preset = q.get("preset", DEFAULT_PRESET_NAME)
+                    if preset not in BG_PRESETS:
+                        return self._reply(400, f"unknown preset: {preset}".encode())
+                    fut = server.submit("remove", data, preset=preset)
+                elif url.path == "/upscale":
+                    model = q.get("model", UPSCALE_MODELS[0])
+                    try:
+                        scale = int(q.get("scale", "4").rstrip("x"))
+                    except ValueError:
+                        scale = None
+                    if model not in UPSCALE_MODELS or f"{scale}x" not in UPSCALE_SCALES:
+                        return self._reply(400, b"unknown model/scale")
+                    fut = server.submit("upscale", data, model=model, scale=scale)
+                else:
+                    return self._reply(404, b"not found")
+                try:
+                    self._reply(200, fut.result(), "image/png")
+                except Exception as e:
+                    self._reply(500, str(e).encode())
+
+        return Handler
+
+    def serve_forever(self):
+        threading.Thread(target=self._worker, daemon=True).start()
+        if self.socket_path:
+            class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+            Path(self.socket_path).unlink(missing_ok=True)
+            self.httpd = UnixServer(self.socket_path, self._handler())
+            print(f"LABOKit server listening on {self.socket_path}")
+        else:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+            print(f"LABOKit server listening on http://{self.host}:{self.port}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+
+class ServerClient:
+    """Talks to a running InferenceServer on localhost"""
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, timeout=600):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    @classmethod
+    def discover(cls):
+        c = cls(timeout=0.3)
+        # Anything else listening on the port must not receive our images
+        try:
+            if c._request("GET", "/health") != SERVER_HEALTH:
+                return None
+        except Exception:
+            return None
+        c.timeout = 600
+        return c
+
+    def _request(self, method, path, body=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, path, body=body)
+            r = conn.getresponse()
+            data = r.read()
+            if r.status != 200:
+                raise RuntimeError(data.decode(errors="replace"))
+            return data
+        finally:
+            conn.close()
+
+    def remove(self, data, preset=DEFAULT_PRESET_NAME):
+        return self._request("POST", f"/remove?preset={quote(preset)}", data)
+
+    def upscale(self, data, model, scale):
+        return self._request("POST", f"/upscale?model={quote(model)}&scale={scale}", data)
+
+
+# ==========================================
+# PLUGIN HOST (OUT-OF-PROCESS)
+# ==========================================
+
+_WORKER_PLUGINS = {}
+
+
+def load_kit_module(path):
+    mod_name = f"plugin_{Path(path).stem}"
+    loader = importlib.machinery.SourceFileLoader(mod_name, str(path))
+    spec = importlib.util.spec_from_file_location(mod_name, str(path), loader=loader)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _plugin_worker(kit_path, func_name, shm_in, shape, dtype, shm_out, out_shape, params):
+    """Runs in a worker process: input and output pixels live in shared memory"""
+    import numpy as np
+
+    if kit_path not in _WORKER_PLUGINS:
+        _WORKER_PLUGINS[kit_path] = load_kit_module(kit_path)
+    func = getattr(_WORKER_PLUGINS[kit_path], func_name)
+
+    src = shared_memory.SharedMemory(name=shm_in)
+    dst = shared_memory.SharedMemory(name=shm_out)
+    try:
+        arr = np.ndarray(shape, dtype, buffer=src.buf)
+        res = np.asarray(func(arr, **params))
+        if res.shape == tuple(out_shape) and res.dtype == np.dtype(dtype):
+            np.ndarray(res.shape, res.dtype, buffer=dst.buf)[...] = res
+            res = None
+        else:
+            # Unexpected shape/dtype: send the array back pickled instead
+            res = np.array(res)
+        # Views of the shared buffers must be gone before closing them
+        del arr
+        return res
+    finally:
+        src.close()
+        dst.close()
+
+
+class PluginHost:
+    """Runs heavy plugin work in worker processes (own GIL, crash isolated).
+
+    A plugin's module-level function `func(image: ndarray, **params) -> ndarray`
+    is called in a worker; pixels are exchanged through shared memory:
+
+        for i, res in window.plugin_host.map(__file__, "process", images,
+                                             params, progress=cb):
+            ...
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self._pool = None
+        self._live = set()  # shared memory blocks of unfinished jobs
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=GOVERNOR.allowed_workers(self.workers),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def submit(self, kit_path, func_name, image, params=None, out_shape=None):
+        """Future resolving to the result ndarray; out_shape defaults to the input shape"""
+        import numpy as np
+
+        if isinstance(image, (str, Path)):
+            with Image.open(image) as im:
+                image = np.asarray(im)
+        arr = np.ascontiguousarray(np.asarray(image))
+        out_shape = tuple(out_shape or arr.shape)
+        out_size = int(np.prod(out_shape)) * arr.itemsize
+
+        shm_in = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        shm_out = shared_memory.SharedMemory(create=True, size=max(1, out_size))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm_in.buf)[...] = arr
+        blocks = (shm_in, shm_out)
+        with self._lock:
+            self._live.add(blocks)
+
+        result = Future()
+
+        def finished(fut):
+            try:
+                if fut.cancelled() or result.cancelled():
+                    return
+                exc = fut.exception()
+                if exc is not None:
+                    if isinstance(exc, BrokenProcessPool):
+                        self._pool = None  # respawn on next submit
+                    result.set_exception(exc)
+                else:
+                    res = fut.result()
+                    if res is None:
+                        res = np.array(np.ndarray(out_shape, arr.dtype, buffer=shm_out.buf))
+                    result.set_result(res)
+            finally:
+                self._release(blocks)
+
+        try:
+            fut = self._get_pool().submit(
+                _plugin_worker, str(kit_path), func_name, shm_in.name, arr.shape,
+                arr.dtype.str, shm_out.name, out_shape, params or {},
+            )
+        except Exception:
+            self._pool = None
+            self._release(blocks)
+            raise
+        fut.add_done_callback(finished)
+        result.add_done_callback(lambda r: r.cancelled() and fut.cancel())
+        return result
+
+    def map(self, kit_path, func_name, images, params=None, progress=None, out_shape=None):
+        """Yields (index, ndarray or exception) as jobs finish.
+
+        progress(done, total) is called on the caller's thread and may return
+        True to cancel. The Qt event loop is pumped while waiting.
+        """
+        images = list(images)
+        # Keep a bounded number of buffers in shared memory at once
+        limit = self.workers * 2
+        todo = list(enumerate(images))
+        running = {}
+        done = 0
+        while todo or running:
+            while todo and len(running) < limit:
+                i, img = todo.pop(0)
+                try:
+                    running[self.submit(kit_path, func_name, img, params, out_shape)] = i
+                except Exception as e:
+                    done += 1
+                    yield i, e
+            if not running:
+                continue
+            finished, _ = wait(running, timeout=0.05, return_when=FIRST_COMPLETED)
+            if QApplication.instance():
+                QApplication.processEvents()
+            for fut in finished:
+                i = running.pop(fut)
+                done += 1
+                yield i, fut.exception() or fut.result()
+            if finished and progress and progress(done, len(images)):
+                for fut in running:
+                    fut.cancel()
+                return
+
+    def _release(self, blocks):
+        with self._lock:
+            if blocks not in self._live:
+                return
+            self._live.discard(blocks)
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for blocks in list(self._live):
+            try:
+                self._release(blocks)
+            except (BufferError, OSError):
+                pass
+
+
+# ==========================================
+# LIVE PREVIEW
+# ==========================================
+
+BG_PREVIEW_SIZE = 512
+UP_PREVIEW_SIZE = 192  # x4 -> 768px result
+
+
+def make_proxy(path, max_side):
+    """Small RGBA copy of the first frame (JPEGs are DCT-scaled while decoding)"""
+    with Image.open(path) as img:
+        img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+        return img.convert("RGBA")
+
+
+def _to_png(img):
+    buf = BytesIO()
+    img.save(buf, "PNG", compress_level=1)
+    return buf.getvalue()
+
+
+class PreviewWorker(QObject):
+    """Runs preview jobs on one background thread; only the newest request is shown"""
+
+    ready = Signal(object, bytes)
+
+    def __init__(self, parent=None, cache_size=64):
+        super().__init__(parent)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._gen = 0
+        self._lock = threading.Lock()
+
+    def request(self, key, fn):
+        """fn() -> PIL image, run off the UI thread unless `key` is cached"""
+        self._gen += 1
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.ready.emit(key, self.cache[key])
+                return
+        gen = self._gen
+        fut = self._pool.submit(lambda: _to_png(fn()))
+        fut.add_done_callback(lambda f: self._done(key, gen, f))
+        self._pending = fut
+
+    def cancel(self):
+        self._gen += 1
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+
+    def _done(self, key, gen, fut):
+        if fut.cancelled() or fut.exception():
+            if fut.exception():
+                print(f"Preview Error: {fut.exception()}")
+            return
+        data = fut.result()
+        with self._lock:
+            self.cache[key] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        # Stale results stay cached but are not shown
+        if gen == self._gen:
+            self.ready.emit(key, data)
+
+
 # ==========================================
 # TABS
 # ==========================================
@@ -147,11 +1746,15 @@ class BgRemoverTab(QWidget):
         self.output_dir = None
         self.output_map = {}
         self.current_preset_name = DEFAULT_PRESET_NAME
+        self.image_info = {}
+        self.image_roots = {}  # path -> folder it was imported from
+        self.sec_per_mp = BG_SEC_PER_MP
         self.presets = BG_PRESETS
         self.pixel_labels = []
         self._running_index = 0
         self._setup_ui()
         self._init_running_text()
+        self._init_preview()
 
     def _setup_ui(self):
         outer = QVBoxLayout(self)
@@ -173,9 +1776,12 @@ class BgRemoverTab(QWidget):
         btns = QHBoxLayout()
         b_add = QPushButton("Add Images…")
         b_add.clicked.connect(self.add_images)
+        b_dir = QPushButton("Add Folder…")
+        b_dir.clicked.connect(self.add_folder)
         b_clr = QPushButton("Clear List")
         b_clr.clicked.connect(self.clear_list)
         btns.addWidget(b_add)
+        btns.addWidget(b_dir)
         btns.addWidget(b_clr)
         left.addLayout(btns)
 
@@ -202,6 +1808,11 @@ class BgRemoverTab(QWidget):
         self.combo.addItems(self.presets.keys())
         self.combo.currentTextChanged.connect(self.on_preset)
         pres_row.addWidget(self.combo)
+        self.chk_prev = QCheckBox("Live Preview")
+        self.chk_prev.toggled.connect(self._schedule_preview)
+        pres_row.addWidget(self.chk_prev)
+        self.chk_mask = QCheckBox("Export Mask")
+        pres_row.addWidget(self.chk_mask)
         right.addLayout(pres_row)
 
         right.addSpacing(10)
@@ -257,18 +1868,44 @@ class BgRemoverTab(QWidget):
         files, _ = QFileDialog.getOpenFileNames(self, "Select Images", "", IMAGE_FILTER)
         if not files:
             return
-        for f in files:
-            p = Path(f)
-            if p not in self.image_paths:
-                self.image_paths.append(p)
-                item = QListWidgetItem(p.name)
-                item.setData(Qt.UserRole, p)
-                self.list_w.addItem(item)
-        if self.list_w.count() > 0:
+        self._add_paths([Path(f) for f in files])
+
+    def add_folder(self):
+        d = QFileDialog.getExistingDirectory(self, "Select Folder (recursive)")
+        if not d:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            root = Path(d)
+            exclude = []
+            if self.output_dir and self.output_dir.is_relative_to(root):
+                exclude.append(self.output_dir.relative_to(root))
+            self._add_paths(scan_images(root, exclude=exclude), root)
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def _add_paths(self, paths, root=None):
+        new = [p for p in dict.fromkeys(paths) if p not in self.image_paths]
+        self.image_info.update(read_image_infos(new))
+        for p in new:
+            self.image_paths.append(p)
+            if root:
+                self.image_roots[p] = root
+            item = QListWidgetItem(p.name)
+            item.setData(Qt.UserRole, p)
+            meta = self.image_info.get(p)
+            tip = f"{p}\n{meta[0]}×{meta[1]} {meta[2]}" if meta else str(p)
+            if meta and meta[3] > 1:
+                tip += f", {meta[3]} frames"
+            item.setToolTip(tip)
+            self.list_w.addItem(item)
+        if self.list_w.count() > 0 and self.list_w.currentRow() < 0:
             self.list_w.setCurrentRow(0)
 
     def clear_list(self):
         self.image_paths.clear()
+        self.image_info.clear()
+        self.image_roots.clear()
         self.output_map.clear()
         self.list_w.clear()
         self._update_prev(None)
@@ -297,6 +1934,12 @@ class BgRemoverTab(QWidget):
         else:
             orig.setText("(error)")
 
+        if self.chk_prev.isChecked():
+            if self._preview_shown != str(path):
+                res.setPixmap(QPixmap())
+                res.setText("(preview…)")
+            return self._schedule_preview()
+
         out = self.output_map.get(path)
         if out and out.exists():
             rpix = QPixmap(str(out))
@@ -316,10 +1959,55 @@ class BgRemoverTab(QWidget):
 
     def on_preset(self, n):
         self.current_preset_name = n
+        self._schedule_preview()
+
+    # --- Live Preview ---
+    def _init_preview(self):
+        self.preview = PreviewWorker(self)
+        self.preview.ready.connect(self._show_preview)
+        self._preview_key = None
+        self._preview_shown = None
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.timeout.connect(self._start_preview)
+
+    def _schedule_preview(self, *_):
+        self.preview.cancel()
+        self._preview_key = None
+        if self.chk_prev.isChecked():
+            self._preview_timer.start(150)
+        else:
+            self._preview_timer.stop()
+            self._preview_shown = None
+            self.on_file_selected(self.list_w.currentRow())
+
+    def _start_preview(self):
+        row = self.list_w.currentRow()
+        if not self.chk_prev.isChecked() or not 0 <= row < len(self.image_paths):
+            return
+        path, preset = self.image_paths[row], self.current_preset_name
+        try:
+            self._preview_key = (str(path), path.stat().st_mtime_ns, preset)
+        except OSError:
+            return
+        self.preview.request(
+            self._preview_key,
+            lambda: remove_background(make_proxy(path, BG_PREVIEW_SIZE), preset),
+        )
+
+    def _show_preview(self, key, data):
+        if key != self._preview_key or not self.chk_prev.isChecked():
+            return
+        res = self.lbl_res.img_lbl
+        pix = QPixmap()
+        pix.loadFromData(data)
+        res.setPixmap(pix.scaled(res.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        res.setText("")
+        self._preview_shown = key[0]
 
     def ensure_out(self, sample):
         if not self.output_dir:
-            self.output_dir = sample.parent / "LABOKit_BG"
+            self.output_dir = self.image_roots.get(sample, sample.parent) / "LABOKit_BG"
             self.output_dir.mkdir(exist_ok=True)
             self.out_lbl.setText(f"BG OUTPUT FOLDER: {self.output_dir}")
             QMessageBox.information(
@@ -346,29 +2034,51 @@ class BgRemoverTab(QWidget):
 
     def _run(self, paths):
         out = self.ensure_out(paths[0])
-        dlg = QProgressDialog("Removing BG...", "Cancel", 0, len(paths), self)
+        preset = self.current_preset_name
+        export_mask = self.chk_mask.isChecked()
+        # Share the models of a running LABOKit server if there is one
+        client = None if export_mask else ServerClient.discover()
+
+        bases = output_bases(paths, self.image_roots, out)
+
+        def job(p):
+            base = bases[p]
+            meta = self.image_info.get(p)
+            if meta and meta[3] > 1:
+                ext = MULTIFRAME_BG_EXT.get(p.suffix.lower(), ".webp")
+                return process_animation(
+                    p,
+                    base.with_name(f"{base.name}_nobg{ext}"),
+                    lambda frames: map_unique_frames(
+                        frames, lambda f: remove_background(f, preset)
+                    ),
+                )
+            data = p.read_bytes()
+            if client:
+                res = client.remove(data, preset)
+            else:
+                mask_path = base.with_name(f"{base.name}_mask.png") if export_mask else None
+                res = remove_background(data, preset, mask_path)
+            opath = base.with_name(f"{base.name}_nobg.png")
+            opath.write_bytes(res)
+            return opath
+
+        run = BatchRun(paths, job, self.image_info, BG_WORKERS, self.sec_per_mp)
+        dlg = QProgressDialog(
+            f"Removing BG... (est. {format_eta(run.eta)})", "Cancel", 0, len(run), self
+        )
         dlg.setWindowModality(Qt.ApplicationModal)
         dlg.show()
 
         cnt = 0
-        import rembg
-
-        for i, p in enumerate(paths):
-            if dlg.wasCanceled():
-                break
-            dlg.setLabelText(f"Processing {p.name}...")
-            QApplication.processEvents()
-            try:
-                res = rembg.remove(
-                    p.read_bytes(), **self.presets.get(self.current_preset_name, {})
-                )
-                opath = out / f"{p.stem}_nobg.png"
-                opath.write_bytes(res)
+        for i, (p, opath, err) in enumerate(run.iter(dlg)):
+            if err:
+                print(err)
+            else:
                 self.output_map[p] = opath
                 cnt += 1
-            except Exception as e:
-                print(e)
             dlg.setValue(i + 1)
+        self.sec_per_mp = run.rate
         dlg.close()
         QMessageBox.information(self, "Done", f"Processed {cnt} images.\nFolder: {out}")
         if self.list_w.currentRow() >= 0:
@@ -380,13 +2090,19 @@ class BgRemoverTab(QWidget):
             "<p>Powered by <b>U^2-Net</b> (Machine Learning).</p>"
             "<hr>"
             "<b>1. Add Images</b><br>"
-            "Drag & drop files or use the 'Add Images' button. Supports JPG, PNG, WEBP, BMP.<br><br>"
+            "Drag & drop files or use the 'Add Images' button. Supports JPG, PNG, WEBP, BMP.<br>"
+            "'Add Folder' imports every image in a folder and its subfolders.<br>"
+            "Large images are processed first, and the estimated time is shown before the run starts.<br>"
+            "Animated GIF/WebP and multi-page TIFF keep all their frames and timing (GIF is saved as WebP).<br><br>"
             "<b>2. Sensitivity Presets</b>"
             "<ul>"
             "<li><b>Standard:</b> Best for general use. Fast & clean edges.</li>"
             "<li><b>Medium:</b> Applies post-processing to smooth rough edges.</li>"
             "<li><b>High:</b> Aggressive alpha matting. Good for hair/fur details but slower.</li>"
             "</ul>"
+            "Tick <b>Live Preview</b> to try presets on a small copy of the selected image.<br>"
+            "Re-running with another preset reuses the cached mask, so only the post-processing runs again. "
+            "Tick <b>Export Mask</b> to also save the grayscale mask (<i>_mask.png</i>).<br><br>"
             "<b>3. Processing</b><br>"
             "Click 'Remove BG (All)' to process the entire list.<br>"
             "Results are saved automatically to the <b>LABOKit_BG</b> folder next to your input files.<br><br>"
@@ -401,10 +2117,14 @@ class UpscalerTab(QWidget):
         self.output_dir = None
         self.output_map = {}
         self.view_path = None
+        self.image_info = {}
+        self.image_roots = {}  # path -> folder it was imported from
+        self.sec_per_mp = UP_SEC_PER_MP
         self.pixel_labels = []
         self._running_index = 0
         self._setup_ui()
         self._init_running_text()
+        self._init_preview()
 
     def _setup_ui(self):
         outer = QVBoxLayout(self)
@@ -426,9 +2146,12 @@ class UpscalerTab(QWidget):
         btns = QHBoxLayout()
         b_add = QPushButton("Add Images…")
         b_add.clicked.connect(self.add_images)
+        b_dir = QPushButton("Add Folder…")
+        b_dir.clicked.connect(self.add_folder)
         b_clr = QPushButton("Clear List")
         b_clr.clicked.connect(self.clear_list)
         btns.addWidget(b_add)
+        btns.addWidget(b_dir)
         btns.addWidget(b_clr)
         left.addLayout(btns)
 
@@ -452,14 +2175,26 @@ class UpscalerTab(QWidget):
         opt = QHBoxLayout()
         opt.addWidget(QLabel("Scale:"))
         self.combo_s = QComboBox()
-        self.combo_s.addItems(["2x", "4x"])
+        self.combo_s.addItems(UPSCALE_SCALES)
         self.combo_s.setCurrentText("4x")
         opt.addWidget(self.combo_s)
         opt.addWidget(QLabel("Model:"))
         self.combo_m = QComboBox()
-        self.combo_m.addItems(["realesrgan-x4plus", "realesrgan-x4plus-anime"])
+        self.combo_m.addItems(UPSCALE_MODELS)
         opt.addWidget(self.combo_m)
+        opt.addWidget(QLabel("Engine:"))
+        self.combo_e = QComboBox()
+        self.combo_e.addItems(UPSCALE_ENGINES.keys())
+        engines = {v: k for k, v in UPSCALE_ENGINES.items()}
+        self.combo_e.setCurrentText(engines.get(GOVERNOR.settings["upscale_engine"], "Auto"))
+        self.combo_e.currentTextChanged.connect(self.on_engine)
+        opt.addWidget(self.combo_e)
+        self.chk_prev = QCheckBox("Live Preview")
+        opt.addWidget(self.chk_prev)
         right.addLayout(opt)
+        self.combo_s.currentTextChanged.connect(self._schedule_preview)
+        self.combo_m.currentTextChanged.connect(self._schedule_preview)
+        self.chk_prev.toggled.connect(self._schedule_preview)
 
         # Buttons
         right.addSpacing(10)
@@ -515,18 +2250,44 @@ class UpscalerTab(QWidget):
         files, _ = QFileDialog.getOpenFileNames(self, "Select Images", "", IMAGE_FILTER)
         if not files:
             return
-        for f in files:
-            p = Path(f)
-            if p not in self.image_paths:
-                self.image_paths.append(p)
-                item = QListWidgetItem(p.name)
-                item.setData(Qt.UserRole, p)
-                self.list_w.addItem(item)
-        if self.list_w.count() > 0:
+        self._add_paths([Path(f) for f in files])
+
+    def add_folder(self):
+        d = QFileDialog.getExistingDirectory(self, "Select Folder (recursive)")
+        if not d:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            root = Path(d)
+            exclude = []
+            if self.output_dir and self.output_dir.is_relative_to(root):
+                exclude.append(self.output_dir.relative_to(root))
+            self._add_paths(scan_images(root, exclude=exclude), root)
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def _add_paths(self, paths, root=None):
+        new = [p for p in dict.fromkeys(paths) if p not in self.image_paths]
+        self.image_info.update(read_image_infos(new))
+        for p in new:
+            self.image_paths.append(p)
+            if root:
+                self.image_roots[p] = root
+            item = QListWidgetItem(p.name)
+            item.setData(Qt.UserRole, p)
+            meta = self.image_info.get(p)
+            tip = f"{p}\n{meta[0]}×{meta[1]} {meta[2]}" if meta else str(p)
+            if meta and meta[3] > 1:
+                tip += f", {meta[3]} frames"
+            item.setToolTip(tip)
+            self.list_w.addItem(item)
+        if self.list_w.count() > 0 and self.list_w.currentRow() < 0:
             self.list_w.setCurrentRow(0)
 
     def clear_list(self):
         self.image_paths.clear()
+        self.image_info.clear()
+        self.image_roots.clear()
         self.output_map.clear()
         self.list_w.clear()
         self._update_prev(None)
@@ -556,6 +2317,12 @@ class UpscalerTab(QWidget):
         else:
             orig.setText("(error)")
 
+        if self.chk_prev.isChecked():
+            if self._preview_shown != str(path):
+                res.setPixmap(QPixmap())
+                res.setText("(preview…)")
+            return self._schedule_preview()
+
         out = self.output_map.get(path)
         if out and out.exists():
             rpix = QPixmap(str(out))
@@ -572,9 +2339,54 @@ class UpscalerTab(QWidget):
         if self.view_path:
             self._update_prev(self.view_path)
 
+    # --- Live Preview ---
+    def _init_preview(self):
+        self.preview = PreviewWorker(self)
+        self.preview.ready.connect(self._show_preview)
+        self._preview_key = None
+        self._preview_shown = None
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.timeout.connect(self._start_preview)
+
+    def _schedule_preview(self, *_):
+        self.preview.cancel()
+        self._preview_key = None
+        if self.chk_prev.isChecked():
+            self._preview_timer.start(150)
+        else:
+            self._preview_timer.stop()
+            self._preview_shown = None
+            self._update_prev(self.view_path)
+
+    def _start_preview(self):
+        path = self.view_path
+        if not self.chk_prev.isChecked() or not path:
+            return
+        scale = int(self.combo_s.currentText().replace("x", ""))
+        model = self.combo_m.currentText()
+        try:
+            self._preview_key = (str(path), path.stat().st_mtime_ns, model, scale)
+        except OSError:
+            return
+        self.preview.request(
+            self._preview_key,
+            lambda: upscale_image(make_proxy(path, UP_PREVIEW_SIZE), model, scale),
+        )
+
+    def _show_preview(self, key, data):
+        if key != self._preview_key or not self.chk_prev.isChecked():
+            return
+        res = self.lbl_res.img_lbl
+        pix = QPixmap()
+        pix.loadFromData(data)
+        res.setPixmap(pix.scaled(res.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        res.setText("")
+        self._preview_shown = key[0]
+
     def ensure_out(self, sample):
         if not self.output_dir:
-            self.output_dir = sample.parent / "LABOKit_UP"
+            self.output_dir = self.image_roots.get(sample, sample.parent) / "LABOKit_UP"
             self.output_dir.mkdir(exist_ok=True)
             self.out_lbl.setText(f"UPSCALE OUTPUT FOLDER: {self.output_dir}")
             QMessageBox.information(
@@ -599,8 +2411,26 @@ class UpscalerTab(QWidget):
             return QMessageBox.info(self, "Info", "Add images first.")
         self._run(self.image_paths)
 
+    def on_engine(self, text):
+        global _VULKAN_FAILED
+        GOVERNOR.settings["upscale_engine"] = UPSCALE_ENGINES[text]
+        _VULKAN_FAILED = False  # picking an engine again retries Vulkan
+        try:
+            save_settings(GOVERNOR.settings)
+        except Exception as e:
+            print(f"Settings error: {e}")
+        self._schedule_preview()
+
     def _run(self, paths):
-        if not REALESRGAN_EXE.exists():
+        if upscale_engine() == "cpu":
+            onnx = esrgan_onnx_path(self.combo_m.currentText())
+            if not onnx.exists():
+                return QMessageBox.warning(
+                    self,
+                    "Error",
+                    f"CPU model not found at:\n{onnx}\nPlace the Real-ESRGAN .onnx model there.",
+                )
+        elif not REALESRGAN_EXE.exists():
             return QMessageBox.warning(
                 self,
                 "Error",
@@ -608,60 +2438,45 @@ class UpscalerTab(QWidget):
             )
 
         out = self.ensure_out(paths[0])
-        dlg = QProgressDialog("Upscaling...", "Cancel", 0, len(paths), self)
-        dlg.setWindowModality(Qt.ApplicationModal)
-        dlg.show()
-
-        cnt = 0
         target_scale = int(self.combo_s.currentText().replace("x", ""))
         model = self.combo_m.currentText()
-
-        for i, p in enumerate(paths):
-            if dlg.wasCanceled():
-                break
-            dlg.setLabelText(f"Processing {p.name}...")
-            QApplication.processEvents()
-
-            try:
-                opath = out / f"{p.stem}_up{target_scale}x.png"
-
-                exec_scale = 4
-
-                cmd = [
-                    str(REALESRGAN_EXE),
-                    "-i",
-                    str(p),
-                    "-o",
-                    str(opath),
-                    "-n",
-                    model,
-                    "-s",
-                    str(exec_scale),
-                ]
-
-                flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
-
-                subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    creationflags=flags,
-                    cwd=str(REALESRGAN_DIR),
+        client = ServerClient.discover()
+
+        bases = output_bases(paths, self.image_roots, out)
+
+        def job(p):
+            base = bases[p]
+            meta = self.image_info.get(p)
+            if meta and meta[3] > 1:
+                return process_animation(
+                    p,
+                    base.with_name(f"{base.name}_up{target_scale}x{p.suffix.lower()}"),
+                    lambda frames: upscale_frames(frames, model, target_scale),
                 )
+            opath = base.with_name(f"{base.name}_up{target_scale}x.png")
+            if client:
+                opath.write_bytes(client.upscale(p.read_bytes(), model, target_scale))
+            else:
+                upscale_file(p, opath, model, target_scale)
+            return opath
 
-                if target_scale == 2:
-                    with Image.open(opath) as img:
-                        new_w = img.width // 2
-                        new_h = img.height // 2
-                        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                        img.save(opath)
+        # One GPU: jobs run one at a time, but still largest first
+        run = BatchRun(paths, job, self.image_info, 1, self.sec_per_mp)
+        dlg = QProgressDialog(
+            f"Upscaling... (est. {format_eta(run.eta)})", "Cancel", 0, len(run), self
+        )
+        dlg.setWindowModality(Qt.ApplicationModal)
+        dlg.show()
 
+        cnt = 0
+        for i, (p, opath, err) in enumerate(run.iter(dlg)):
+            if err:
+                print(f"Upscale Error: {err}")
+            else:
                 self.output_map[p] = opath
                 cnt += 1
-            except Exception as e:
-                print(f"Upscale Error: {e}")
-
             dlg.setValue(i + 1)
-
+        self.sec_per_mp = run.rate
         dlg.close()
         QMessageBox.information(self, "Done", f"Upscaled {cnt} images.\nFolder: {out}")
         if self.list_w.currentItem():
@@ -673,16 +2488,22 @@ class UpscalerTab(QWidget):
             "<p>Powered by <b>Real-ESRGAN</b> (NCNN Vulkan).</p>"
             "<hr>"
             "<b>1. Add Images</b><br>"
-            "Load low-resolution images you want to enhance.<br><br>"
+            "Load low-resolution images you want to enhance, or a whole folder tree with 'Add Folder'.<br>"
+            "Animated GIF/WebP and multi-page TIFF are upscaled frame by frame.<br><br>"
             "<b>2. Model Selection</b>"
             "<ul>"
             "<li><b>realesrgan-x4plus:</b> Best for photos, realistic textures, and general images.</li>"
             "<li><b>realesrgan-x4plus-anime:</b> Optimized for 2D illustration, anime, and line art (faster & sharper lines).</li>"
             "</ul>"
             "<b>3. Scale Factor</b><br>"
-            "Choose <b>4x</b> for maximum detail or <b>2x</b> for a quicker resize.<br><br>"
+            "Choose <b>4x</b> for maximum detail or <b>2x</b> for a quicker resize.<br>"
+            "Tick <b>Live Preview</b> to compare models on a small copy of the selected image.<br><br>"
+            "<b>4. Engine</b><br>"
+            "<b>Vulkan (NCNN)</b> runs on the GPU. <b>CPU (ONNX)</b> runs anywhere using the "
+            "<i>models/&lt;model&gt;.onnx</i> files, tile by tile, at a slower but steady speed. "
+            "<b>Auto</b> uses Vulkan when it is available and works, otherwise the CPU.<br><br>"
             "<b>⚠️ Hardware Note:</b><br>"
-            "This feature requires a Vulkan-compatible GPU. On first run, it might take a few seconds to initialize."
+            "The Vulkan engine requires a Vulkan-compatible GPU. On first run, it might take a few seconds to initialize."
         )
         QMessageBox.information(self, "Help – Upscaler", text)
 
@@ -692,6 +2513,87 @@ class UpscalerTab(QWidget):
 # ==========================================
 
 
+class SettingsDialog(QDialog):
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Performance Settings")
+        self.settings = dict(settings)
+        form = QFormLayout(self)
+
+        self.sp_intra = QSpinBox()
+        self.sp_intra.setRange(0, os.cpu_count() or 64)
+        self.sp_intra.setSpecialValueText("All cores")
+        self.sp_intra.setValue(settings["intra_op_threads"])
+        form.addRow("ONNX intra-op threads:", self.sp_intra)
+
+        self.sp_inter = QSpinBox()
+        self.sp_inter.setRange(0, os.cpu_count() or 64)
+        self.sp_inter.setSpecialValueText("Default")
+        self.sp_inter.setValue(settings["inter_op_threads"])
+        form.addRow("ONNX inter-op threads:", self.sp_inter)
+
+        self.ed_esrgan = QLineEdit(settings["esrgan_threads"])
+        self.ed_esrgan.setPlaceholderText("1:2:2 (load:proc:save)")
+        form.addRow("Real-ESRGAN threads (-j):", self.ed_esrgan)
+
+        self.sp_ram = QSpinBox()
+        self.sp_ram.setRange(0, 1024 * 1024)
+        self.sp_ram.setSingleStep(512)
+        self.sp_ram.setSuffix(" MB")
+        self.sp_ram.setSpecialValueText("No limit")
+        self.sp_ram.setValue(settings["ram_limit_mb"])
+        form.addRow("RAM ceiling:", self.sp_ram)
+
+        self.cb_provider = QComboBox()
+        self.cb_provider.addItems(self._provider_choices())
+        self.cb_provider.setCurrentText(settings["ort_provider"])
+        form.addRow("ONNX execution provider:", self.cb_provider)
+
+        self.cb_graph = QComboBox()
+        self.cb_graph.addItems(GRAPH_OPT_LEVELS)
+        self.cb_graph.setCurrentText(settings["graph_opt_level"])
+        form.addRow("Graph optimization:", self.cb_graph)
+
+        self.chk_nice = QCheckBox("Run at low priority (restart to undo)")
+        self.chk_nice.setChecked(settings["low_priority"])
+        form.addRow(self.chk_nice)
+
+        self.chk_adapt = QCheckBox("Reduce parallel jobs under memory pressure / high load")
+        self.chk_adapt.setChecked(settings["adaptive"])
+        form.addRow(self.chk_adapt)
+
+        bb = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        bb.accepted.connect(self.accept)
+        bb.rejected.connect(self.reject)
+        form.addRow(bb)
+
+    @staticmethod
+    def _provider_choices():
+        try:
+            import onnxruntime as ort
+
+            available = set(ort.get_available_providers())
+        except ImportError:
+            available = set()
+        return [k for k, v in ORT_PROVIDERS.items() if k in ("auto", "cpu") or v[0] in available]
+
+    def accept(self):
+        jobs = self.ed_esrgan.text().strip()
+        if jobs and not re.fullmatch(r"\d+:\d+(,\d+)*:\d+", jobs):
+            return QMessageBox.warning(self, "Error", "Real-ESRGAN threads must look like 1:2:2")
+        self.settings.update(
+            intra_op_threads=self.sp_intra.value(),
+            inter_op_threads=self.sp_inter.value(),
+            esrgan_threads=jobs,
+            ram_limit_mb=self.sp_ram.value(),
+            low_priority=self.chk_nice.isChecked(),
+            adaptive=self.chk_adapt.isChecked(),
+            ort_provider=self.cb_provider.currentText(),
+            graph_opt_level=self.cb_graph.currentText(),
+        )
+        super().accept()
+
+
 class LABOKitMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -702,6 +2604,7 @@ class LABOKitMainWindow(QMainWindow):
         self.tabs.addTab(self.bg_tab, "BG Remover")
         self.tabs.addTab(self.up_tab, "Upscaler")
         self.setCentralWidget(self.tabs)
+        self.plugin_host = PluginHost()
         self.loaded_plugins = []
         self._setup_menu()
         self._load_plugins()
@@ -721,13 +2624,7 @@ class LABOKitMainWindow(QMainWindow):
         # Load new
         for f in PLUGIN_DIR.glob("*.kit"):
             try:
-                mod_name = f"plugin_{f.stem}"
-                loader = importlib.machinery.SourceFileLoader(mod_name, str(f))
-                spec = importlib.util.spec_from_file_location(
-                    mod_name, str(f), loader=loader
-                )
-                mod = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(mod)
+                mod = load_kit_module(f)
 
                 if hasattr(mod, "create_tab"):
                     tab = mod.create_tab(self)
@@ -772,6 +2669,20 @@ class LABOKitMainWindow(QMainWindow):
             except Exception as e:
                 QMessageBox.warning(self, "Error", str(e))
 
+    def show_settings(self):
+        dlg = SettingsDialog(GOVERNOR.settings, self)
+        if dlg.exec():
+            try:
+                save_settings(dlg.settings)
+            except Exception as e:
+                QMessageBox.warning(self, "Error", str(e))
+            GOVERNOR.update(dlg.settings)
+            reset_sessions()
+
+    def closeEvent(self, e):
+        self.plugin_host.shutdown()
+        super().closeEvent(e)
+
     def open_url(self, url):
         QDesktopServices.openUrl(QUrl(url))
 
@@ -780,11 +2691,15 @@ class LABOKitMainWindow(QMainWindow):
 
         file = mb.addMenu("&File")
         file.addAction("Add Images...", self.add_images_curr)
+        file.addAction("Add Folder...", self.add_folder_curr)
         file.addAction("Change Output Folder...", self.change_out_curr)
+        file.addAction("Process Video...", self.process_video)
         file.addSeparator()
         file.addAction("Exit", self.close)
 
         conf = mb.addMenu("&Config")
+        conf.addAction("Performance Settings...", self.show_settings)
+        conf.addSeparator()
         conf.addAction("Load Plugin (.kit)...", self.load_plugin_file)
         conf.addAction(
             "Open Plugins Folder",
@@ -815,11 +2730,63 @@ class LABOKitMainWindow(QMainWindow):
         if hasattr(w, "add_images"):
             w.add_images()
 
+    def add_folder_curr(self):
+        w = self.tabs.currentWidget()
+        if hasattr(w, "add_folder"):
+            w.add_folder()
+
     def change_out_curr(self):
         w = self.tabs.currentWidget()
         if hasattr(w, "change_output_folder"):
             w.change_output_folder()
 
+    def process_video(self):
+        w = self.tabs.currentWidget()
+        if w is self.up_tab:
+            scale = int(w.combo_s.currentText().replace("x", ""))
+            process = video_upscale(w.combo_m.currentText(), scale)
+            suffix, title = f"_up{scale}x.mp4", "Upscaling video..."
+        else:
+            process = video_remove_bg(self.bg_tab.current_preset_name)
+            suffix, title = "_nobg.webm", "Removing BG from video..."
+
+        src, _ = QFileDialog.getOpenFileName(self, "Select Video", "", VIDEO_FILTER)
+        if not src:
+            return
+        src = Path(src)
+        dst, _ = QFileDialog.getSaveFileName(
+            self, "Save Video As", str(src.with_name(src.stem + suffix)),
+            "Video (*.mp4 *.mov *.mkv *.webm)",
+        )
+        if not dst:
+            return
+
+        try:
+            pipe = VideoPipeline(src, dst, process)
+        except Exception as e:
+            return QMessageBox.warning(self, "Error", f"Cannot read video:\n{e}")
+
+        dlg = QProgressDialog(title, "Cancel", 0, pipe.info["frames"], self)
+        dlg.setWindowModality(Qt.ApplicationModal)
+        dlg.show()
+
+        def progress(done, total):
+            dlg.setLabelText(f"Frame {done}/{total or '?'}")
+            dlg.setValue(min(done, total) if total else 0)
+            QApplication.processEvents()
+            return dlg.wasCanceled()
+
+        try:
+            n = pipe.run(progress)
+        except Exception as e:
+            dlg.close()
+            return QMessageBox.warning(self, "Error", str(e))
+        # closing the dialog emits canceled(), so read the flag first
+        cancelled = dlg.wasCanceled()
+        dlg.close()
+        if not cancelled:
+            QMessageBox.information(self, "Done", f"Processed {n} frames.\nFile: {dst}")
+
     def show_bg_help(self):
         self.bg_tab.show_help()
 
@@ -841,7 +2808,59 @@ class LABOKitMainWindow(QMainWindow):
         dlg.exec()
 
 
+# ==========================================
+# COMMAND LINE
+# ==========================================
+
+
+def cli_main(argv):
+    ap = argparse.ArgumentParser(prog="labokit")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    srv = sub.add_parser("serve", help="run the local inference server")
+    srv.add_argument("--host", default=SERVER_HOST)
+    srv.add_argument("--port", type=int, default=SERVER_PORT)
+    srv.add_argument("--socket", default=SERVER_SOCKET, help="Unix socket path")
+    srv.add_argument("--batch", type=int, default=8)
+
+    vid = sub.add_parser("video", help="remove BG from / upscale a video file")
+    vid.add_argument("src")
+    vid.add_argument("dst")
+    vid.add_argument("--mode", choices=["remove", "upscale"], default="remove")
+    vid.add_argument("--preset", choices=list(BG_PRESETS), default=DEFAULT_PRESET_NAME)
+    vid.add_argument("--model", choices=UPSCALE_MODELS, default=UPSCALE_MODELS[0])
+    vid.add_argument("--scale", choices=[2, 4], type=int, default=4)
+    vid.add_argument("--queue", type=int, default=8, help="max frames in memory")
+
+    args = ap.parse_args(argv)
+    deploy_assets()
+    GOVERNOR.apply_priority()
+    prune_mask_cache()
+    if args.cmd == "serve":
+        get_session()
+        InferenceServer(args.host, args.port, args.socket, args.batch).serve_forever()
+    elif args.cmd == "video":
+        if args.mode == "remove":
+            process = video_remove_bg(args.preset)
+        else:
+            process = video_upscale(args.model, args.scale)
+
+        def progress(done, total):
+            print(f"\rframe {done}/{total or '?'}", end="", flush=True)
+
+        n = VideoPipeline(args.src, args.dst, process, args.queue).run(progress)
+        print(f"\nwrote {n} frames to {args.dst}")
+    return 0
+
+
+CLI_COMMANDS = ("serve", "video")
+
+
 def main():
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(cli_main(sys.argv[1:]))
+
     app = QApplication(sys.argv)
     app.setApplicationName("LABOKit")
     if ICON_PATH.exists():
@@ -865,14 +2884,15 @@ def main():
 
     # Silent Deploy
     deploy_assets()
+    GOVERNOR.apply_priority()
+    prune_mask_cache()
 
-    # Warmup
-    try:
-        from rembg import remove as r_rem
-
-        r_rem(b"\x00" * 10)
-    except:
-        pass
+    # Warmup (skipped when a LABOKit server already holds the models)
+    if not ServerClient.discover():
+        try:
+            get_session()
+        except:
+            pass
 
     # Style
     app.setStyleSheet("""